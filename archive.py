@@ -0,0 +1,78 @@
+import os
+import pickle
+import struct
+import zlib
+
+from snapshots import atomic_write
+
+ARCHIVE_PATH = "data/barobets.archive"
+INDEX_PATH = "data/barobets.index"
+
+# every record in the archive file is a header followed by a zlib compressed
+# pickle of the game's record: (game id, length of the compressed data)
+HEADER = struct.Struct(">II")
+
+class Archive:
+    """Append-only store for barobet games that are finished or deleted.
+
+    Only the small id -> (offset, length) index is kept in memory, games are
+    read back from disk one at a time when someone asks for them."""
+
+    def __init__(self, path=ARCHIVE_PATH, index_path=INDEX_PATH):
+        self.path = path
+        self.index_path = index_path
+        self.index = {}
+
+        if os.path.isfile(index_path):
+            with open(index_path, "rb") as fp:
+                self.index = pickle.load(fp)
+        elif os.path.isfile(path):
+            self.rebuild_index()
+
+    def __contains__(self, game_id):
+        return game_id in self.index
+
+    def add(self, game_id, record):
+        data = zlib.compress(pickle.dumps(record))
+
+        with open(self.path, "ab") as fp:
+            fp.write(HEADER.pack(game_id, len(data)))
+            offset = fp.tell()
+            fp.write(data)
+            fp.flush()
+            os.fsync(fp.fileno())
+
+        # a later copy of the same game wins
+        self.index[game_id] = (offset, len(data))
+        self.save_index()
+
+    def get(self, game_id):
+        if game_id not in self.index:
+            return None
+
+        offset, length = self.index[game_id]
+        with open(self.path, "rb") as fp:
+            fp.seek(offset)
+            data = fp.read(length)
+
+        return pickle.loads(zlib.decompress(data))
+
+    def save_index(self):
+        atomic_write(self.index_path, pickle.dumps(self.index))
+
+    def rebuild_index(self):
+        """Scan the whole archive, for when the index file has gone missing."""
+        self.index = {}
+        size = os.path.getsize(self.path)
+        with open(self.path, "rb") as fp:
+            while True:
+                header = fp.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    break
+                game_id, length = HEADER.unpack(header)
+                if fp.tell() + length > size:
+                    # torn write at the end, the state still has this game
+                    break
+                self.index[game_id] = (fp.tell(), length)
+                fp.seek(length, os.SEEK_CUR)
+        self.save_index()
@@ -8,6 +8,13 @@ async def new_game(cyclone_dt, state, ctx, close_dt=None):
     await ctx.send(f"<@&{GAMER_ROLE}> Guessing for cyclone on **{g.cyclone_dt_str()}** now open.\nGuessing closes **{g.close_dt_str()}**\n*Game #{g.game_id}*.")
     return g
 
+def from_record(record, state):
+    """Rebuild a game from the plain dict made by `Game.to_record`."""
+    g = Game.__new__(Game)
+    g.__dict__.update(record)
+    g.state = state
+    return g
+
 class Game():
     def __init__(self, cyclone_dt, state, ctx, close_dt):
         if close_dt == None:
@@ -21,6 +28,7 @@ class Game():
         self.actual = None
         self.state = state
         self.finished = False
+        self.deleted = False
 
         game_id = state.add_barobet(self)
         self.game_id = game_id
@@ -30,6 +38,13 @@ class Game():
     def save(self):
         self.state.save()
 
+    def to_record(self):
+        # plain data only, so it can be unpickled without this module and
+        # without dragging the whole state along
+        record = dict(self.__dict__)
+        del record["state"]
+        return record
+
     def close_dt_str(self):
         d = self.close_dt
         eastern = d.astimezone(ZoneInfo("America/New_York"))
@@ -46,8 +61,7 @@ class Game():
 
         userid = player.userid
 
-        now = dt.datetime.now(dt.timezone.utc)
-        if now > self.close_dt:
+        if now() > self.close_dt:
             # don't allow late guesses
             await ctx.send(f"Guessing closed at `{self.close_dt_str()}`")
         
@@ -140,7 +154,7 @@ class Game():
                 await ctx.send(f"Congratulations to {first_place} for first place, as well as {second_place} and {third_place} for a spot on the podium!{after_text}")
 
             self.finished = True
-            self.save()
+            self.state.archive_barobet(self)
             await self.send_guess_board(ctx)
 
         else: # no real-world pressure has been added
@@ -173,7 +187,7 @@ class Game():
             # sort highest to lowest
             guesses = sorted(self.guesses.values(), key=lambda x: x["value"])
             for g in guesses:
-                user = await ctx.bot.fetch_user(g["userid"])
+                user = await fetch_user(ctx.bot, g["userid"])
                 s += f"{g['value']:.1f} - {user.name}\n"
 
         else:
@@ -183,7 +197,7 @@ class Game():
             # display actual guess and error
             guesses = sorted(self.guesses.values(), key=lambda x: abs(x["error"]))
             for g in guesses:
-                user = await ctx.bot.fetch_user(g["userid"])
+                user = await fetch_user(ctx.bot, g["userid"])
                 s += f"{g['value']:.1f} ({g['error']:.1f}) - {user.name}\n"
 
         em = discord.Embed(title=title, description=s)
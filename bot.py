@@ -1,11 +1,25 @@
-import player, games, global_state, barobets
+import sys
+from startup import Profiler
+
+# python bot.py --profile-startup prints how long each import and load stage took
+profile = Profiler(enabled="--profile-startup" in sys.argv)
+
+with profile.stage("import discord"):
+    import discord
+    from discord.ext import commands, tasks
+
+player, games, global_state, barobets, warmup, snapshots, cooldowns, charts, stocks, tracelog, memprof = profile.imports(
+    "player", "games", "global_state", "barobets", "warmup", "snapshots", "cooldowns", "charts", "stocks", "tracelog", "memprof")
+
+# python bot.py --trace records every command that changes the state for replay.py
+tracelog.enabled = "--trace" in sys.argv
 from common import *
 
+import asyncio
 import datetime as dt
+import os
 import re
-
-import discord
-from discord.ext import commands, tasks
+import threading
 import typing
 
 
@@ -13,17 +27,91 @@ import typing
 
 intents = discord.Intents.default()
 intents.message_content = True
+intents.members = True # needed to request member chunks on startup
 
-bot = commands.Bot(command_prefix="$", intents=intents)
+# the members intent would otherwise make discord.py download every member of
+# every guild before on_ready. warmup fetches just the players instead
+bot = commands.Bot(command_prefix="$", intents=intents, chunk_guilds_at_startup=False)
+
+@bot.before_invoke
+async def pin_trace_time(ctx):
+    tracelog.pin_time()
+
+warmed_up = False
 
 @bot.event
 async def on_ready():
+    global warmed_up
     print(f'We have logged in as {bot.user}')
 
+    # on_ready fires again on every reconnect, only warm up once
+    if not warmed_up:
+        warmed_up = True
+        profile.end("connect")
+        with profile.stage("warm caches"):
+            seconds, resolved, total = await warmup.warm(bot, state)
+        percent = 100 * resolved / total if total > 0 else 100
+        print(f"Warmed caches in {seconds:.2f}s, resolved {resolved}/{total} players ({percent:.0f}%)")
+        profile.report()
+
+        take_snapshot.start()
+        watch_games.start()
+        settle_jackpot.start()
+        start_price_feed()
+
+def start_price_feed():
+    # $chart only has prices if something records them, so run the finnhub
+    # feed alongside the bot. it blocks, so it gets a thread of its own
+    if not os.path.isfile("data/finnhub_token.config"):
+        print("No data/finnhub_token.config, not recording prices")
+        return
+    import finnhub
+    threading.Thread(target=finnhub.ws_connect, name="finnhub", daemon=True).start()
+
+@tasks.loop(minutes=30)
+async def take_snapshot():
+    # copy the state here, pickle and write it off the event loop
+    captured = snapshots.capture(state)
+    path, written, total = await asyncio.to_thread(snapshots.write, captured)
+    print(f"Snapshot {path}: wrote {written}/{total} chunks")
+    tracelog.checkpoint(state)
+
+@tasks.loop(minutes=1)
+async def settle_jackpot():
+    if state.jackpot.pending:
+        tracelog.record("settle_jackpot", None)
+    state.jackpot.settle()
+
+@tasks.loop(seconds=30)
+async def watch_games():
+    if games.changed():
+        try:
+            games.reload()
+            print(f"Reloaded games from {games.GAMES_PATH}")
+        except ValueError as e:
+            print(f"Not reloading games, {games.GAMES_PATH} is invalid:\n{e}")
+
 @bot.check
 async def globally_block_dms(ctx):
     return (ctx.guild is not None) or is_admin()
 
+limits = cooldowns.Cooldowns()
+
+# check_once, not check: plain checks also run whenever something asks whether
+# a command could run (every command listed by $help), and this one uses tokens
+@bot.check_once
+async def globally_rate_limit(ctx):
+    if ctx.author.id == ADMIN:
+        return True
+    return limits.check(ctx.author.id, ctx.command.qualified_name)
+
+@bot.event
+async def on_command_error(ctx, error):
+    if isinstance(error, cooldowns.OnCooldown):
+        # already counted, replying would just feed the flood
+        return
+    await commands.Bot.on_command_error(bot, ctx, error)
+
 def is_admin():
     async def predicate(ctx):
         return ctx.author.id == ADMIN
@@ -37,6 +125,8 @@ async def hi(ctx):
 
 @bot.hybrid_command()
 async def bal(ctx):
+    # a first $bal makes an account, and any $bal can hand out the daily tickets
+    tracelog.record("bal", ctx.author.id)
     p = await player.get(state, ctx)
     await p.send_status(ctx)
 
@@ -44,22 +134,36 @@ async def bal(ctx):
 async def leaderboard(ctx):
     tor = tornago(ctx)
 
-    players = state.get_players().values()
-    players = sorted(players, key=lambda x: x.net_worth(), reverse=True)
-
+    # already in order, kept sorted as balances change
     s = ""
-    for p in players:
-        user = await ctx.bot.fetch_user(p.userid)
-        s += f"{p.net_worth()} ({p.get_coins()} {tor}) - {user.name}\n"
+    for userid in state.leaderboard.top():
+        p = state.get_player(userid)
+        user = await fetch_user(ctx.bot, userid)
+        stars = f" ✦{p.prestige}" if p.prestige > 0 else ""
+        s += f"{p.leaderboard_value()} ({p.get_coins()} {tor}){stars} - {user.name}\n"
 
-    em = discord.Embed(title="**Leaderboard** (by net worth)", description=s)
+    em = discord.Embed(title="**Leaderboard** (by net worth, prestige included)", description=s)
 
     await ctx.send(embed=em)
 
+@bot.hybrid_command(name="prestige")
+async def prestige_up(ctx):
+    tracelog.record("prestige", ctx.author.id)
+    p = await player.get(state, ctx)
+    tor = tornago(ctx)
+
+    if p.do_prestige():
+        await ctx.send(f"{ctx.author.mention} reached prestige {p.prestige}! Game winnings are now x{p.payout_multiplier():g}.")
+    elif p.next_prestige_at() == None:
+        await ctx.send(f"You're already at max prestige ({p.prestige}).")
+    else:
+        await ctx.send(f"You need {p.next_prestige_at()} {tor} to reach prestige {p.prestige + 1}, you have {p.get_coins()} {tor}.")
+
 
 
 @bot.hybrid_command()
 async def buy_tickets(ctx, count: int):
+    tracelog.record("buy_tickets", ctx.author.id, count=count)
     p = await player.get(state, ctx)
     for i in range(count):
         p.buy_ticket()
@@ -97,19 +201,29 @@ async def lottox(ctx):
 async def states(ctx):
     await games.play("states", state, ctx)
 
+@bot.hybrid_command()
+async def jackpot(ctx):
+    em = discord.Embed(title="**Progressive Jackpot**", description=f"{state.jackpot.total()} {tornago(ctx)}")
+    em.set_footer(text="Win it with a jackpot in lotto or lottox")
+    await ctx.send(embed=em)
+
 
 
 @bot.hybrid_command()
 async def lockitin(ctx, pressure: float, id=-1, no_bet=""):
     do_bet = no_bet.lower() not in ["no_bet", "no bet", "nobet"]
+    tracelog.record("lockitin", ctx.author.id, pressure=pressure, id=id, do_bet=do_bet)
     pl = await player.get(state, ctx)
-    bb = state.get_barobet(id)
-    await bb.guess(pl, pressure, ctx, do_bet=do_bet)
+    bb = await get_barobet(ctx, id)
+    if bb != None:
+        await bb.guess(pl, pressure, ctx, do_bet=do_bet)
 
 @bot.hybrid_command(name="baroboard")
 async def barobet_board(ctx, id=-1):
-    bb = state.get_barobet(id)
-    await bb.send_guess_board(ctx)
+    # finished games are paged in from the archive
+    bb = await get_barobet(ctx, id)
+    if bb != None:
+        await bb.send_guess_board(ctx)
 
 @bot.hybrid_command(name="bbnew")
 @is_admin()
@@ -128,25 +242,81 @@ async def barobet_new(ctx, day, hour_utc: int, close_date=None, close_hour=None)
             await ctx.send(f"Could not parse close time `{day}`, `{hour_utc}`.")
             return
 
+    tracelog.record("bbnew", ctx.author.id, cyclone=cyclone_dt.isoformat(),
+                    close=close_dt.isoformat() if close_dt != None else None)
     await barobets.new_game(cyclone_dt, state, ctx, close_dt=close_dt)
 
 @bot.hybrid_command(name="bbdel")
 @is_admin()
 async def barobet_delete(ctx, id=-1):
+    tracelog.record("bbdel", ctx.author.id, id=id)
     bb = state.del_barobet(id=id)
-    await ctx.send(f"Deleted game {id}")
+    if bb == None:
+        await ctx.send(f"No game {id}")
+    else:
+        await ctx.send(f"Deleted game {bb.game_id}")
 
 @bot.hybrid_command(name="bbobs")
 @is_admin()
 async def barobet_observe(ctx, pressure: float, id=-1):
-    bb = state.get_barobet(id)
-    await bb.observe_pressure(pressure)
+    tracelog.record("bbobs", ctx.author.id, pressure=pressure, id=id)
+    bb = await get_barobet(ctx, id)
+    if bb != None:
+        await bb.observe_pressure(pressure)
 
 @bot.hybrid_command(name="bbfinish")
 @is_admin()
 async def barobet_finish(ctx, id=-1):
+    tracelog.record("bbfinish", ctx.author.id, id=id)
+    bb = await get_barobet(ctx, id)
+    if bb != None:
+        await bb.send_rewards(ctx)
+
+async def get_barobet(ctx, id):
     bb = state.get_barobet(id)
-    await bb.send_rewards(ctx)
+    if bb == None:
+        await ctx.send(f"No game {id}")
+    return bb
+
+
+
+@bot.hybrid_command()
+async def chart(ctx, symbol: str):
+    times, prices = await asyncio.to_thread(stocks.history, symbol)
+    if len(prices) == 0:
+        await ctx.send(f"No prices recorded for `{symbol}`")
+        return
+    png = await charts.render(charts.draw_prices, symbol, times, prices)
+    await charts.send(ctx, png)
+
+@bot.hybrid_command()
+async def balchart(ctx, user: typing.Optional[discord.User] = None):
+    if user == None:
+        user = ctx.author
+    # looking at someone's chart shouldn't sign them up
+    p = state.players.get(user.id)
+    if p == None:
+        await ctx.send(f"{user.display_name} doesn't have an account.")
+        return
+
+    times, coins = await asyncio.to_thread(player.balance_history, user.id)
+    times.append(dt.datetime.now(dt.timezone.utc))
+    coins.append(p.get_coins())
+
+    png = await charts.render(charts.draw_balance, user.display_name, times, coins)
+    await charts.send(ctx, png)
+
+@bot.hybrid_command()
+async def bbchart(ctx, id=-1):
+    bb = await get_barobet(ctx, id)
+    if bb == None:
+        return
+    values = [g["value"] for g in bb.guesses.values()]
+    if len(values) == 0:
+        await ctx.send(f"No guesses yet for game #{bb.game_id}")
+        return
+    png = await charts.render(charts.draw_guesses, bb.game_id, values, bb.actual)
+    await charts.send(ctx, png)
 
 
 
@@ -194,6 +364,7 @@ def parse_day_hour(day, hour):
 @bot.hybrid_command()
 @is_admin()
 async def tickets(ctx, action: str, amount: int, user: discord.User):
+    tracelog.record("tickets", ctx.author.id, action=action, amount=amount, user=user.id)
     p = await player.get_id(state, user.id, ctx)
 
     p.refresh_tickets()
@@ -218,19 +389,23 @@ async def tickets(ctx, action: str, amount: int, user: discord.User):
 @bot.hybrid_command()
 @is_admin()
 async def coins(ctx, action: str, amount: int, user: discord.User):
+    tracelog.record("coins", ctx.author.id, action=action, amount=amount, user=user.id)
     p = await player.get_id(state, user.id, ctx)
     
     action = action.lower()
     if action == "set":
         p.coins = amount
+        p.balance_changed()
         await p.send_status(ctx)
         p.save()
     elif action in ["add", "give"]:
         p.coins += amount
+        p.balance_changed()
         await p.send_status(ctx)
         p.save()
     elif action in ["take", "remove", "subtract", "sub"]:
         p.coins -= amount
+        p.balance_changed()
         await p.send_status(ctx)
         p.save()
     else:
@@ -240,19 +415,99 @@ async def coins(ctx, action: str, amount: int, user: discord.User):
 @bot.hybrid_command()
 @is_admin()
 async def delete_user(ctx, user: discord.User):
-    p = state.players.pop(user.id, None)
-    if p != None:
-        del p
+    tracelog.record("delete_user", ctx.author.id, user=user.id)
+    state.del_player(user.id)
     await ctx.send(f"Deleted {user.name}")
 
 
+@bot.hybrid_command()
+@is_admin()
+async def reload_games(ctx):
+    try:
+        defs = games.reload()
+    except ValueError as e:
+        await ctx.send(f"Games not reloaded, still using the old ones:\n```\n{e}\n```")
+        return
+
+    s = ""
+    for key, game in defs.games.items():
+        s += f"{game['name']} - costs {game['cost']} :tickets:, pays {defs.evs[key]:.2f} on average\n"
+    em = discord.Embed(title="**Reloaded games**", description=s)
+    await ctx.send(embed=em)
+
+
+@bot.hybrid_command(name="memprof")
+@is_admin()
+async def memory_profile(ctx, action: str, amount: typing.Optional[int] = None, minutes: typing.Optional[int] = None):
+    # amount is frames to keep for start, lines to show for top and objects
+    action = action.lower()
+    lines = min(amount or 10, memprof.MAX_LINES)
+    if action == "start":
+        frames, minutes = memprof.start(amount or 1, minutes or memprof.DEFAULT_MINUTES)
+        await ctx.send(f"Started allocation sampling ({frames} frames per allocation), stopping in {minutes} minutes")
+    elif action == "stop":
+        memprof.stop()
+        await ctx.send("Stopped allocation sampling")
+    elif action in ["top", "dump"] and not memprof.tracemalloc.is_tracing():
+        await ctx.send("Not sampling, run `$memprof start` first")
+    elif action == "top":
+        await ctx.send("```\n" + "\n".join(memprof.top(lines)) + "\n```")
+    elif action == "dump":
+        path = await asyncio.to_thread(memprof.dump)
+        await ctx.send(f"Dumped snapshot diff to `{path}`")
+    elif action == "objects":
+        # walking everything can take a moment with a lot of players
+        skip = [global_state.State]
+        players = await asyncio.to_thread(memprof.breakdown, state.players.values(), skip)
+        bbs = await asyncio.to_thread(memprof.breakdown, state.barobets.values(), skip)
+        s = f"**Players** ({len(state.players)})\n```\n" + "\n".join(memprof.format_breakdown(players, lines)) + "\n```"
+        s += f"**Open barobets** ({len(state.barobets)}, {len(state.archive.index)} archived)\n```\n" + "\n".join(memprof.format_breakdown(bbs, lines)) + "\n```"
+        await ctx.send(s)
+    else:
+        await ctx.send(f"Unknown command `{action}`")
+
+
+@bot.hybrid_command()
+@is_admin()
+async def cooldown(ctx, action: str, user: discord.User):
+    action = action.lower()
+    if action == "exempt":
+        limits.exempt.add(user.id)
+        await ctx.send(f"{user.name} is exempt from cooldowns")
+    elif action == "unexempt":
+        limits.exempt.discard(user.id)
+        await ctx.send(f"{user.name} is no longer exempt from cooldowns")
+    elif action == "reset":
+        limits.reset(user.id)
+        await ctx.send(f"Reset cooldowns for {user.name}")
+    else:
+        await ctx.send(f"Unknown command `{action}`")
+
+
+@bot.hybrid_command(name="cooldowns")
+@is_admin()
+async def cooldown_stats(ctx):
+    s = ""
+    for command, count in limits.rejected.most_common():
+        s += f"{count} - {command}\n"
+    if s == "":
+        s = "Nothing rejected yet."
+
+    em = discord.Embed(title="**Rejected by cooldown**", description=s)
+    await ctx.send(embed=em)
+
+
 
 # run client -------------------------------------------------------------------
 
-state = global_state.load()
+# chart workers import this file too, they mustn't start a bot of their own
+if __name__ == "__main__":
+    state = global_state.load(profile)
+    tracelog.start(state, global_state.STATE_PATH)
 
-with open("data/discord_token.config") as fp:
-    token = fp.read()
-token = token.strip()
+    with open("data/discord_token.config") as fp:
+        token = fp.read()
+    token = token.strip()
 
-bot.run(token)
\ No newline at end of file
+    profile.begin("connect")
+    bot.run(token)
\ No newline at end of file
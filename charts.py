@@ -0,0 +1,88 @@
+import asyncio
+import datetime as dt
+import hashlib
+import io
+import multiprocessing
+import pickle
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import discord
+
+# rendered pngs by a hash of what went into them, so a chart is only drawn again
+# once its data has changed
+CACHE_SIZE = 64
+cache = OrderedDict()
+
+pool = None
+
+def get_pool():
+    global pool
+    if pool == None:
+        # forkserver, not fork: by the time anyone asks for a chart the bot has
+        # threads running, and forking those can leave a worker holding a lock
+        # nobody will release. workers come from a clean server process instead.
+        pool = ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("forkserver"))
+    return pool
+
+async def render(draw, *args):
+    """Run one of the draw_ functions below in the process pool, or return the
+    cached png if it's been drawn with exactly these arguments before."""
+    key = hashlib.sha256(pickle.dumps((draw.__name__, args))).hexdigest()
+    if key in cache:
+        cache.move_to_end(key)
+        return cache[key]
+
+    loop = asyncio.get_running_loop()
+    png = await loop.run_in_executor(get_pool(), draw, *args)
+
+    cache[key] = png
+    if len(cache) > CACHE_SIZE:
+        cache.popitem(last=False)
+    return png
+
+async def send(ctx, png, name="chart.png"):
+    await ctx.send(file=discord.File(io.BytesIO(png), filename=name))
+
+
+# drawing, runs in the worker processes ----------------------------------------
+
+def new_figure():
+    # imported here so the bot itself never loads matplotlib
+    from matplotlib.figure import Figure
+    return Figure(figsize=(8, 4), dpi=100)
+
+def to_png(fig):
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight")
+    return buf.getvalue()
+
+def draw_prices(symbol, times, prices):
+    fig = new_figure()
+    ax = fig.subplots()
+    ax.plot([dt.datetime.fromtimestamp(t, dt.timezone.utc) for t in times], prices)
+    ax.set_title(symbol)
+    ax.set_ylabel("Price")
+    fig.autofmt_xdate()
+    return to_png(fig)
+
+def draw_balance(name, times, coins):
+    fig = new_figure()
+    ax = fig.subplots()
+    ax.step(times, coins, where="post")
+    ax.set_title(f"{name}'s balance")
+    ax.set_ylabel("Coins")
+    fig.autofmt_xdate()
+    return to_png(fig)
+
+def draw_guesses(game_id, values, actual):
+    fig = new_figure()
+    ax = fig.subplots()
+    ax.hist(values, bins=min(20, max(1, len(values))))
+    if actual != None:
+        ax.axvline(actual, color="red", label=f"Observed {actual:.1f}")
+        ax.legend()
+    ax.set_title(f"Guesses for game #{game_id}")
+    ax.set_xlabel("Pressure (mb)")
+    ax.set_ylabel("Guesses")
+    return to_png(fig)
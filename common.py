@@ -1,14 +1,48 @@
+import contextvars
+import datetime as dt
+
 import discord
 
 # config -----------------------------------------------------------------------
 
 ADMIN = 396730242460418058
 GAMER_ROLE = 1312520586265886742
+TICKET_PRICE = 20 # coins
+
+# caches -----------------------------------------------------------------------
+
+# users we had to fetch over REST (not in any guild the bot can see). users that
+# share a guild with the bot live in discord.py's own cache after warm-up.
+user_cache = {}
+emoji_cache = {}
+
+# the replay tool pins this so replays see the same time as the original run,
+# and so does the bot while tracing. a context variable, so every command (each
+# runs in its own task) has its own pinned time
+pinned_now = contextvars.ContextVar("pinned_now", default=None)
 
 # functions --------------------------------------------------------------------
 
+def now():
+    pinned = pinned_now.get()
+    if pinned != None:
+        return pinned
+    return dt.datetime.now(dt.timezone.utc)
+
 def tornago(ctx):
-    return discord.utils.get(ctx.bot.emojis, name="tornago")
+    emoji = emoji_cache.get("tornago")
+    if emoji == None:
+        emoji = discord.utils.get(ctx.bot.emojis, name="tornago")
+        emoji_cache["tornago"] = emoji
+    return emoji
+
+async def get_user(userid, ctx):
+    return await fetch_user(ctx.bot, userid)
 
-async def get_user(self, userid, ctx):
-    return await ctx.bot.fetch_user(userid)
\ No newline at end of file
+async def fetch_user(bot, userid):
+    # gateway cache first, then our own cache, then REST
+    user = bot.get_user(userid) or user_cache.get(userid)
+    if user == None:
+        user = await bot.fetch_user(userid)
+        user_cache[userid] = user
+    return user
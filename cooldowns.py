@@ -0,0 +1,93 @@
+import time
+from collections import Counter
+
+from discord.ext import commands
+
+# command name: (burst size, seconds to earn back one use)
+LIMITS = {
+    "play": (5, 3),
+    "testplay": (5, 3),
+    "d6": (5, 3),
+    "d20": (5, 3),
+    "l8": (5, 3),
+    "lotto": (5, 3),
+    "lottox": (5, 3),
+    "states": (5, 3),
+    "buy_tickets": (3, 5),
+    "lockitin": (3, 10),
+}
+
+# every command a user runs also comes out of this one
+USER_LIMIT = (10, 1)
+
+# once a table gets this big, forget users whose buckets have refilled. the
+# next prune waits until the table has doubled from what's left, so a table
+# full of busy users isn't rescanned on every command.
+PRUNE_AT = 10000
+
+class OnCooldown(commands.CheckFailure):
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        super().__init__(f"On cooldown, try again in {retry_after:.1f}s")
+
+class Buckets:
+    """Token buckets for one limit, keyed by user id.
+
+    Each bucket is just (tokens, last time) and is topped up when it's looked
+    at, so there are no timers. A user with no entry has a full bucket."""
+
+    def __init__(self, capacity, per):
+        self.capacity = capacity
+        self.per = per
+        self.buckets = {}
+        self.prune_at = PRUNE_AT
+
+    def tokens(self, key, now):
+        tokens, last = self.buckets.get(key, (self.capacity, now))
+        return min(self.capacity, tokens + (now - last) / self.per)
+
+    def take(self, key, now):
+        self.buckets[key] = (self.tokens(key, now) - 1, now)
+        if len(self.buckets) > self.prune_at:
+            self.prune(now)
+
+    def retry_after(self, key, now):
+        return (1 - self.tokens(key, now)) * self.per
+
+    def prune(self, now):
+        full = [key for key in self.buckets if self.tokens(key, now) >= self.capacity]
+        for key in full:
+            del self.buckets[key]
+        self.prune_at = max(PRUNE_AT, 2 * len(self.buckets))
+
+class Cooldowns:
+    def __init__(self, limits=LIMITS, user_limit=USER_LIMIT):
+        self.commands = {name: Buckets(*limit) for name, limit in limits.items()}
+        self.users = Buckets(*user_limit)
+        self.exempt = set()
+        self.rejected = Counter()
+
+    def check(self, userid, command):
+        """Take a use of `command` for the user, or raise OnCooldown without
+        taking anything if either their command or overall bucket is empty."""
+        if userid in self.exempt:
+            return True
+
+        now = time.monotonic()
+        buckets = [self.users]
+        if command in self.commands:
+            buckets.append(self.commands[command])
+
+        empty = [b for b in buckets if b.tokens(userid, now) < 1]
+        if empty:
+            self.rejected[command] += 1
+            raise OnCooldown(max(b.retry_after(userid, now) for b in empty))
+
+        for b in buckets:
+            b.take(userid, now)
+        return True
+
+    def reset(self, userid):
+        self.users.buckets.pop(userid, None)
+        for b in self.commands.values():
+            b.buckets.pop(userid, None)
@@ -0,0 +1,270 @@
+"""Stream the game state to and from NDJSON, one player, game or guess per
+line, without the bot or its classes.
+
+    python export.py export [--at TIME] [--since DATE] [--game ID] > state.ndjson
+    python export.py import state.ndjson [--resume] [--force]
+
+Exports read a snapshot (the latest, or the latest at or before --at) one chunk
+at a time, plus the barobet archive one game at a time. Imports write a new
+snapshot and archive into ./data, then `python snapshots.py restore <time>`
+turns that into data/state.pickle."""
+
+import argparse
+import datetime as dt
+import json
+import os
+import pickle
+import shutil
+import sys
+
+import snapshots
+from archive import Archive
+from jackpot import Jackpot
+
+# field order of player records in snapshots from before they said so themselves
+DEFAULT_PLAYER_FIELDS = ("tickets", "last_checked", "coins", "stocks", "prestige")
+
+GAME_TIMES = ["cyclone_dt", "close_dt"]
+
+WORK_DIR = "data/import-work"
+CHECKPOINT_EVERY = 1000
+
+def encode(o):
+    if isinstance(o, dt.datetime):
+        return o.isoformat()
+    raise TypeError(f"Can't export {type(o).__name__}")
+
+def parse_time(text):
+    return dt.datetime.fromisoformat(text) if text != None else None
+
+# export -----------------------------------------------------------------------
+
+def game_lines(record, is_open):
+    game = {k: v for k, v in record.items() if k != "guesses"}
+    yield {"type": "game", "open": is_open, **game}
+    for guess in record["guesses"].values():
+        yield {"type": "guess", "game_id": record["game_id"], **guess}
+
+def export(manifest_path, since=None, game_id=None):
+    """Generate every line of the export, holding one snapshot chunk or one
+    game in memory at a time."""
+    with open(manifest_path) as fp:
+        manifest = json.load(fp)
+    rest = pickle.loads(snapshots.get_object(manifest["rest"]))
+    fields = rest.get("player_fields", DEFAULT_PLAYER_FIELDS)
+
+    if game_id == None:
+        for digest in manifest["players"]:
+            for userid, record in pickle.loads(snapshots.get_object(digest)):
+                p = dict(zip(fields, record))
+                if since != None and p["last_checked"].date() < since:
+                    continue
+                yield {"type": "player", "userid": userid, **p}
+
+    for id, blob in sorted(rest["barobets"].items()):
+        if game_id == None or id == game_id:
+            yield from game_lines(pickle.loads(blob), True)
+
+    archive = Archive()
+    for id in sorted(archive.index.keys()):
+        if (game_id == None or id == game_id) and id not in rest["barobets"]:
+            yield from game_lines(archive.get(id), False)
+
+    # saves from before the jackpot have none, or None from an old import
+    if game_id == None and rest.get("jackpot") != None:
+        yield {"type": "jackpot", **rest["jackpot"]}
+
+# import -----------------------------------------------------------------------
+
+class Importer:
+    """Reads lines into spill files under WORK_DIR, one per snapshot chunk, so
+    only one chunk ever needs to be in memory. Replaying a line twice is
+    harmless, which is what makes --resume work: it skips the lines before
+    the last checkpoint and redoes anything after it."""
+
+    def __init__(self):
+        os.makedirs(WORK_DIR, exist_ok=True)
+        self.archive = Archive()
+        self.spills = {}
+        self.game = None
+        self.next_barobet_id = 0
+        self.player_fields = DEFAULT_PLAYER_FIELDS
+
+    def spill(self, name, line):
+        if name not in self.spills:
+            self.spills[name] = open(os.path.join(WORK_DIR, name), "a")
+        self.spills[name].write(json.dumps(line, default=encode) + "\n")
+
+    def add(self, line):
+        if line["type"] == "guess":
+            self.game["guesses"][line["userid"]] = {k: v for k, v in line.items() if k not in ["type", "game_id"]}
+            return
+
+        self.finish_game()
+
+        if line["type"] == "player":
+            self.spill(f"players-{line['userid'] % snapshots.CHUNKS}", line)
+        elif line["type"] == "jackpot":
+            self.spill("jackpot", line)
+        elif line["type"] == "game":
+            self.game = {k: v for k, v in line.items() if k != "type"}
+            self.game["guesses"] = {}
+            for k in GAME_TIMES:
+                self.game[k] = parse_time(self.game[k])
+        else:
+            raise ValueError(f"Unknown line type {line['type']}")
+
+    def finish_game(self):
+        if self.game == None:
+            return
+        game, self.game = self.game, None
+
+        self.next_barobet_id = max(self.next_barobet_id, game["game_id"] + 1)
+        if game.pop("open"):
+            self.spill("open-games", game)
+        else:
+            self.archive.add(game["game_id"], game)
+
+    def checkpoint(self, done):
+        """Only called between games, so a resume never starts mid-game."""
+        sizes = {}
+        for name, fp in self.spills.items():
+            fp.flush()
+            os.fsync(fp.fileno())
+            sizes[name] = fp.tell()
+        progress = {"done": done, "sizes": sizes}
+        snapshots.atomic_write(os.path.join(WORK_DIR, "progress"), json.dumps(progress).encode())
+
+    def rewind(self):
+        """Cut the spill files back to the last checkpoint, so nothing is half
+        written, and return how many lines it had done."""
+        path = os.path.join(WORK_DIR, "progress")
+        if not os.path.isfile(path):
+            return 0
+        with open(path) as fp:
+            progress = json.load(fp)
+
+        for name in os.listdir(WORK_DIR):
+            if name == "progress":
+                continue
+            if name in progress["sizes"]:
+                os.truncate(os.path.join(WORK_DIR, name), progress["sizes"][name])
+            else:
+                os.remove(os.path.join(WORK_DIR, name))
+        return progress["done"]
+
+    def read_spill(self, name):
+        path = os.path.join(WORK_DIR, name)
+        if not os.path.isfile(path):
+            return
+        with open(path) as fp:
+            for line in fp:
+                yield json.loads(line)
+
+    def finish(self):
+        """Turn the spill files into a snapshot, returns its manifest path."""
+        self.finish_game()
+        for fp in self.spills.values():
+            fp.close()
+        self.spills = {}
+
+        os.makedirs(snapshots.OBJECT_DIR, exist_ok=True)
+
+        chunks = []
+        for i in range(snapshots.CHUNKS):
+            players = {}
+            for line in self.read_spill(f"players-{i}"):
+                line["last_checked"] = parse_time(line["last_checked"])
+                players[line["userid"]] = tuple(line[f] for f in self.player_fields)
+            digest, new = snapshots.put_object(pickle.dumps(sorted(players.items())))
+            chunks.append(digest)
+
+        open_games = {}
+        for game in self.read_spill("open-games"):
+            for k in GAME_TIMES:
+                game[k] = parse_time(game[k])
+            game["guesses"] = {int(k): v for k, v in game["guesses"].items()}
+            open_games[game["game_id"]] = pickle.dumps(game)
+
+        jackpot = Jackpot().to_record()
+        for line in self.read_spill("jackpot"):
+            jackpot = {k: v for k, v in line.items() if k != "type"}
+            jackpot["pending"] = {int(k): v for k, v in jackpot["pending"].items()}
+
+        # the archive and the open games spill may already know about later
+        # games from a resumed run
+        next_id = max([self.next_barobet_id] + [id + 1 for id in self.archive.index]
+                      + [id + 1 for id in open_games])
+
+        rest = {
+            "version": snapshots.STATE_VERSION,
+            "player_fields": self.player_fields,
+            "barobets": open_games,
+            "next_barobet_id": next_id,
+            "jackpot": jackpot,
+        }
+        digest, new = snapshots.put_object(pickle.dumps(rest))
+
+        path = snapshots.write_manifest(dt.datetime.now(dt.timezone.utc), chunks, digest)
+        shutil.rmtree(WORK_DIR)
+        return path
+
+def import_lines(lines, resume=False):
+    if not resume and os.path.isdir(WORK_DIR):
+        shutil.rmtree(WORK_DIR)
+
+    importer = Importer()
+    skip = importer.rewind() if resume else 0
+    last_checkpoint = skip
+
+    for n, line in enumerate(lines, start=1):
+        if n <= skip:
+            continue
+        line = json.loads(line)
+
+        # anything but a guess means the game before it is complete
+        if n - 1 - last_checkpoint >= CHECKPOINT_EVERY and line["type"] != "guess":
+            importer.finish_game()
+            importer.checkpoint(n - 1)
+            last_checkpoint = n - 1
+
+        importer.add(line)
+
+    return importer.finish()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export or import the game state as NDJSON.")
+    sub = parser.add_subparsers(dest="action", required=True)
+
+    p_export = sub.add_parser("export")
+    p_export.add_argument("--at", help="use the latest snapshot at or before this time")
+    p_export.add_argument("--since", help="only players active on or after this date")
+    p_export.add_argument("--game", type=int, help="only this barobet game and its guesses")
+
+    p_import = sub.add_parser("import")
+    p_import.add_argument("file")
+    p_import.add_argument("--resume", action="store_true", help="carry on from the last checkpoint")
+    p_import.add_argument("--force", action="store_true", help="import even though data/state.pickle exists")
+
+    args = parser.parse_args()
+
+    if args.action == "export":
+        when = snapshots.parse_time(args.at) if args.at else dt.datetime.now(dt.timezone.utc)
+        path = snapshots.find(when)
+        if path == None:
+            print("No snapshot to export from", file=sys.stderr)
+            sys.exit(1)
+
+        since = dt.date.fromisoformat(args.since) if args.since else None
+        for line in export(path, since=since, game_id=args.game):
+            sys.stdout.write(json.dumps(line, default=encode) + "\n")
+
+    else:
+        if os.path.isfile("data/state.pickle") and not args.force:
+            print("data/state.pickle exists, importing would mix into a live bot's data. Use --force if you mean it.", file=sys.stderr)
+            sys.exit(1)
+
+        with open(args.file) as fp:
+            path = import_lines(fp, resume=args.resume)
+        print(f"Imported into snapshot {path}, run `python snapshots.py restore <time>` to use it")
@@ -3,6 +3,7 @@
 #https://pypi.org/project/websocket_client/
 import websocket
 import json
+import stocks
 
 
 
@@ -14,14 +15,15 @@ def on_message(ws, message):
             last_trade = j["data"][-1]
             price = last_trade["p"]
             stock = last_trade["s"]
-            print(f"{stock}: {price}")
+            # print(f"{stock}: {price}")
+            stocks.record(stock, price, last_trade["t"] / 1000)
     except:
         pass
 
 def on_error(ws, error):
     print(error)
 
-def on_close(ws):
+def on_close(ws, close_status_code, close_msg):
     print("### closed ###")
 
 def on_open(ws):
@@ -33,7 +35,7 @@ def on_open(ws):
 def ws_connect():
     with open("data/finnhub_token.config") as fp:
         token = fp.read()
-    token.strip()
+    token = token.strip()
 
     # websocket.enableTrace(True)
     ws = websocket.WebSocketApp("wss://ws.finnhub.io?token=" + token,
@@ -41,7 +43,8 @@ def ws_connect():
                               on_error = on_error,
                               on_close = on_close)
     ws.on_open = on_open
-    ws.run_forever()
+    # keep reconnecting, the bot runs this for as long as it's up
+    ws.run_forever(reconnect=5)
 
 if __name__ == "__main__":
     ws_connect()
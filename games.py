@@ -1,16 +1,34 @@
 from common import *
-import random
+import json
+import os
 import discord
 import player as pl
+import rng
+import tracelog
+
+# game definitions can be overridden without a restart by putting them in this
+# file (same shape as DEFAULT_GAMES) and running $reload_games, or waiting for
+# the watcher to notice
+GAMES_PATH = "data/games.json"
+
+async def play(game_name, state, ctx, testplay=False, seed=None):
+    # hold on to the definitions for the whole play, a reload halfway through
+    # only affects plays that start after it
+    defs = current
+
+    # every play gets its own random stream, shown with the result and traced,
+    # so any play can be checked or replayed from its seed
+    if seed == None:
+        seed = rng.new_seed()
+    tracelog.record("play", ctx.author.id, game=game_name, testplay=testplay, seed=seed)
 
-async def play(game_name, state, ctx, testplay=False):
     player = await pl.get(state, ctx)
 
     game_name = game_name.lower()
-    result = get_result(game_name)
+    result = defs.get_result(game_name, rng.Stream(seed))
 
     if result == None:
-        ctx.send(f"Unknown game `{game_name}`")
+        await ctx.send(f"Unknown game `{game_name}`")
     else:
 
         if testplay:
@@ -19,7 +37,10 @@ async def play(game_name, state, ctx, testplay=False):
             paid = await collect_tickets(result["cost"], player, ctx)
 
         if paid or testplay:
-            await confirm_result(result, player, ctx, paid)
+            apply_prestige(result, player)
+            if result["pool_share"] > 0:
+                add_jackpot(result, player, state, paid)
+            await confirm_result(result, player, ctx, paid, seed)
 
 
 async def collect_tickets(ticket_cost, player, ctx):
@@ -30,7 +51,25 @@ async def collect_tickets(ticket_cost, player, ctx):
         return False
 
 
-async def confirm_result(result, player, ctx, paid):
+def apply_prestige(result, player):
+    # the jackpot pool goes on after this, so it isn't multiplied
+    multiplier = player.payout_multiplier()
+    if result["coins"] > 0 and multiplier != 1:
+        result["coins"] = int(result["coins"] * multiplier)
+        result["text"] += f"\n(x{multiplier:g} prestige bonus)"
+
+
+def add_jackpot(result, player, state, paid):
+    pot = state.jackpot
+    if paid:
+        pot.contribute(player.userid, result["pool_share"] * result["cost"])
+    if result["jackpot"]:
+        # a test play only shows what it would have won
+        result["coins"] += pot.win() if paid else pot.total()
+    result["pool"] = pot.total()
+
+
+async def confirm_result(result, player, ctx, paid, seed):
     coins = result["coins"]
 
     if paid:
@@ -43,203 +82,304 @@ async def confirm_result(result, player, ctx, paid):
         # save state
         player.save()
 
+        if player.check_prestige():
+            result["text"] += "\nYou have enough coins to `$prestige`!"
+
 
     # embed
     user = await player.get_user(ctx)
     em = discord.Embed(color=user.accent_color)
     em.set_author(name=result["name"])
     em.description = f"*{result['description']}*"
-    
+
     text = result["text"]
     if coins < 0:
         text += f"\n(Lost {coins} {tornago(ctx)})"
     else:
         text += f"\n(Won {coins} {tornago(ctx)})"
-    
+
     em.add_field(name=result["outcome"], value=text, inline=False)
     if paid:
         # em.add_field(name=ctx.author.display_name, value="", inline=False)
         player.add_status_embed(em, ctx)
-    
+
+    if "pool" in result:
+        em.add_field(name="Jackpot:", value=f"{result['pool']} {tornago(ctx)}", inline=True)
+
+    em.set_footer(text=f"Seed {seed:016x}")
 
     await ctx.send(embed=em)
 
 
-def get_result(game):
-
-    if "lazy" in game or "eight" in game or game in ["l8", "8"]:
-        return lazy_eights()
-    elif game in ["d6", "dice", "die"]:
-        return d6()
-    elif game in ["d20"]:
-        return d20()
-    elif game in ["lotto", "lottery"]:
-        return lotto()
-    elif game in ["lotto_x", "lotto_ex", "lotto_extreme", "lotto_xtreme", "lottox", "lottoex", "lottoextreme", "lottoxtreme"]:
-        return lotto_xtreme()
-    elif game in ["state", "states", "ohio", "oh"]:
-        return states_game()
-    else:
-        return None
+def get_result(game, stream):
+    return current.get_result(game, stream)
 
 
+# definitions ------------------------------------------------------------------
 
+# each game rolls 1 to "sides" and pays out the first outcome whose "upto" is at
+# least the roll. "outcome" can use {roll}, and {label} if the game has labels
+# (one per side).
+#
+# games with a "pool_share" put that many coins per ticket into the shared
+# progressive jackpot, and an outcome with "jackpot": true wins the whole pool
+# on top of its own coins.
 
-# games ------------------------------------------------------------------------
+states = ["Alabama","Alaska","Arizona","Arkansas","California","Colorado","Connecticut","Delaware","Florida","Georgia","Hawaii","Idaho","Illinois","Indiana","Iowa","Kansas","Kentucky","Louisiana","Maine","Maryland","Massachusetts","Michigan","Minnesota","Mississippi","Missouri","Montana","Nebraska","Nevada","New Hampshire","New Jersey","New Mexico","New York","North Carolina","North Dakota","Ohio","Oklahoma","Oregon","Pennsylvania","Rhode Island","South Carolina","South Dakota","Tennessee","Texas","Utah","Vermont","Virginia","Washington","West Virginia","Wisconsin","Wyoming"]
 
-def lazy_eights():
-    
-    result = {
+DEFAULT_GAMES = {
+    "l8": {
         "name": "Lazy Eights",
         "description": "Oh, so you're boring?",
+        "aliases": ["l8", "8"],
+        "contains": ["lazy", "eight"],
         "cost": 1,
-        "outcome": "Win",
-        "text": "Shocking. You won.",
-        "coins": 8,
-    }
-
-    return result
-
-
-def d6():
-
-    roll = random.randint(1, 6)
-
-    outcome = f"Roll: {roll}"
-    text = ""
-    coins = (roll - 1) * 4
-
-    result = {
+        "sides": 1,
+        "outcomes": [
+            {"upto": 1, "outcome": "Win", "text": "Shocking. You won.", "coins": 8},
+        ],
+    },
+    "d6": {
         "name": "d6",
         "description": "As simple as it gets.",
+        "aliases": ["d6", "dice", "die"],
         "cost": 1,
-        "outcome": outcome,
-        "text": text,
-        "coins": coins,
-    }
-
-    return result
-
-
-def d20():
-
-    roll = random.randint(1, 20)
-
-    outcome = f"Roll: {roll}"
-    
-    if roll == 20:
-        text = "NATURAL 20!"
-        coins = 200
-    else:
-        text = ""
-        coins = 0
-    
-    result = {
+        "sides": 6,
+        "outcomes": [
+            {"upto": roll, "outcome": "Roll: {roll}", "text": "", "coins": (roll - 1) * 4}
+            for roll in range(1, 7)
+        ],
+    },
+    "d20": {
         "name": "d20",
         "description": "C'mon, nat 20...",
+        "aliases": ["d20"],
         "cost": 1,
-        "outcome": outcome,
-        "text": text,
-        "coins": coins,
-    }
-
-    return result
-
-
-def lotto():
-
-    roll = random.randint(1, 1000)
-
-    if roll == 1:
-        outcome = "JACKPOT!!!"
-        text = ""
-        coins = 9000,
-    elif roll <= 100:
-        outcome = "Win"
-        text = "You won a minor prize!"
-        coins = 20
-    else:
-        outcome = "Try Again"
-        text = "Better luck next time!"
-        coins = 0
-
-    result = {
+        "sides": 20,
+        "outcomes": [
+            {"upto": 19, "outcome": "Roll: {roll}", "text": "", "coins": 0},
+            {"upto": 20, "outcome": "Roll: {roll}", "text": "NATURAL 20!", "coins": 200},
+        ],
+    },
+    "lotto": {
         "name": "Lotto",
         "description": "Jackpot or Bust!",
+        "aliases": ["lotto", "lottery"],
         "cost": 1,
-        "outcome": outcome,
-        "text": text,
-        "coins": coins,
-    }
-
-    return result
-
-
-
-def lotto_xtreme():
-
-    roll = random.randint(1, 10000)
-
-    if roll == 1:
-        outcome = "JACKPOT!!!!!"
-        text = ""
-        coins = 50000,
-    elif roll <= 10:
-        outcome = "Mega Win!"
-        text = ""
-        coins = 5000
-    elif roll <= 100:
-        outcome = "Big Win"
-        text = ""
-        coins = 50
-    elif roll <= 600:
-        outcome = "Win"
-        text = "You won a minor prize!"
-        coins = 10
-    else:
-        outcome = "Try Again"
-        text = "Better luck next time!"
-        coins = 0
-
-    result = {
+        "sides": 1000,
+        "pool_share": 2,
+        "outcomes": [
+            {"upto": 1, "outcome": "JACKPOT!!!", "text": "", "coins": 9000, "jackpot": True},
+            {"upto": 100, "outcome": "Win", "text": "You won a minor prize!", "coins": 20},
+            {"upto": 1000, "outcome": "Try Again", "text": "Better luck next time!", "coins": 0},
+        ],
+    },
+    "lottox": {
         "name": "Lotto XTREME",
         "description": "XTREME JACKPOT POTENTIAL",
+        "aliases": ["lotto_x", "lotto_ex", "lotto_extreme", "lotto_xtreme", "lottox", "lottoex", "lottoextreme", "lottoxtreme"],
         "cost": 1,
-        "outcome": outcome,
-        "text": text,
-        "coins": coins,
-    }
+        "sides": 10000,
+        "pool_share": 4,
+        "outcomes": [
+            {"upto": 1, "outcome": "JACKPOT!!!!!", "text": "", "coins": 50000, "jackpot": True},
+            {"upto": 10, "outcome": "Mega Win!", "text": "", "coins": 5000},
+            {"upto": 100, "outcome": "Big Win", "text": "", "coins": 50},
+            {"upto": 600, "outcome": "Win", "text": "You won a minor prize!", "coins": 10},
+            {"upto": 10000, "outcome": "Try Again", "text": "Better luck next time!", "coins": 0},
+        ],
+    },
+    "states": {
+        "name": "State Roulette",
+        "description": "Don't get Ohio!",
+        "aliases": ["state", "states", "ohio", "oh"],
+        "cost": 1,
+        "sides": 50,
+        # the special states go first so the outcomes can pick them out
+        "labels": ["New Hampshire", "Ohio"] + [s for s in states if s not in ["New Hampshire", "Ohio"]],
+        "outcomes": [
+            {"upto": 1, "outcome": "{label}", "text": "Based.", "coins": 200},
+            {"upto": 2, "outcome": "{label}", "text": "Looks like you're going to the shadow realm, Jimbo", "coins": -950},
+            {"upto": 50, "outcome": "{label}", "text": "", "coins": 25},
+        ],
+    },
+}
+
+class Definitions:
+    """One validated, read-only set of games. Reloading builds a new one and
+    swaps it in, nothing ever modifies one in place."""
+
+    def __init__(self, games):
+        errors = validate(games)
+        if errors:
+            raise ValueError("\n".join(errors))
+
+        self.games = games
+        self.aliases = {}
+        for key, game in games.items():
+            for alias in game["aliases"]:
+                self.aliases[alias] = game
+        self.evs = {key: expected_value(game) for key, game in games.items()}
+
+    def find(self, name):
+        if name in self.aliases:
+            return self.aliases[name]
+        for game in self.games.values():
+            if any(part in name for part in game.get("contains", [])):
+                return game
+        return None
 
-    return result
+    def get_result(self, name, stream):
+        game = self.find(name)
+        if game == None:
+            return None
+
+        roll = stream.randint(1, game["sides"])
+        for tier in game["outcomes"]:
+            if roll <= tier["upto"]:
+                break
+
+        label = game["labels"][roll - 1] if "labels" in game else ""
+
+        return {
+            "name": game["name"],
+            "description": game["description"],
+            "cost": game["cost"],
+            "outcome": tier["outcome"].format(roll=roll, label=label),
+            "text": tier["text"],
+            "coins": tier["coins"],
+            "pool_share": game.get("pool_share", 0),
+            "jackpot": tier.get("jackpot", False),
+        }
+
+def expected_value(game):
+    """Average coins paid out per play, worked out over every possible roll."""
+    total = 0
+    last = 0
+    for tier in game["outcomes"]:
+        total += (tier["upto"] - last) * tier["coins"]
+        last = tier["upto"]
+    return total / game["sides"]
+
+def validate(games):
+    """Returns a list of everything wrong with a set of game definitions.
+    Never raises, whatever shape the definitions are in."""
+    errors = []
+    seen_aliases = {}
+
+    def is_int(x):
+        return isinstance(x, int) and not isinstance(x, bool)
+
+    def is_strings(x):
+        return isinstance(x, list) and all(isinstance(i, str) for i in x)
+
+    if not isinstance(games, dict):
+        return [f"games must be an object of name: game, not {type(games).__name__}"]
+
+    for key, game in games.items():
+        before = len(errors)
+
+        if not isinstance(game, dict):
+            errors.append(f"{key}: must be an object, not {type(game).__name__}")
+            continue
+
+        missing = [k for k in ["name", "description", "aliases", "cost", "sides", "outcomes"] if k not in game]
+        if missing:
+            errors.append(f"{key}: missing {', '.join(missing)}")
+            continue
+
+        if not isinstance(game["name"], str) or not isinstance(game["description"], str):
+            errors.append(f"{key}: name and description must be text")
+        if not is_int(game["cost"]) or game["cost"] < 1:
+            errors.append(f"{key}: cost must be a whole number of tickets, at least 1")
+            continue
+        if not is_int(game["sides"]) or game["sides"] < 1:
+            errors.append(f"{key}: sides must be a whole number, at least 1")
+            continue
+        if "labels" in game and (not is_strings(game["labels"]) or len(game["labels"]) != game["sides"]):
+            errors.append(f"{key}: labels must be a list of text, one per side")
+        pool_share = game.get("pool_share", 0)
+        if not is_int(pool_share) or pool_share < 0:
+            errors.append(f"{key}: pool_share must be a whole number of coins")
+            continue
+
+        if not is_strings(game["aliases"]) or not is_strings(game.get("contains", [])):
+            errors.append(f"{key}: aliases and contains must be lists of text")
+            continue
+        for alias in game["aliases"]:
+            if alias in seen_aliases:
+                errors.append(f"{key}: alias `{alias}` is already used by {seen_aliases[alias]}")
+            seen_aliases[alias] = key
+
+        if not isinstance(game["outcomes"], list) or not all(isinstance(t, dict) for t in game["outcomes"]):
+            errors.append(f"{key}: outcomes must be a list of objects")
+            continue
+
+        last = 0
+        for tier in game["outcomes"]:
+            if not is_int(tier.get("coins")):
+                errors.append(f"{key}: payouts must be whole numbers of coins, got {tier.get('coins')!r}")
+            if not is_int(tier.get("upto")) or tier["upto"] <= last:
+                errors.append(f"{key}: outcomes must have increasing whole number `upto`s")
+                break
+            last = tier["upto"]
+            if not isinstance(tier.get("jackpot", False), bool):
+                errors.append(f"{key}: jackpot must be true or false")
+            try:
+                tier["outcome"].format(roll=1, label="")
+                tier["text"] + ""
+            except (KeyError, IndexError, ValueError, AttributeError, TypeError) as e:
+                errors.append(f"{key}: bad outcome text {e!r}")
+        else:
+            if last != game["sides"]:
+                errors.append(f"{key}: outcomes must cover every roll up to {game['sides']}")
 
+        if pool_share == 0 and any(tier.get("jackpot", False) for tier in game["outcomes"]):
+            errors.append(f"{key}: has a jackpot outcome but no pool_share feeding it")
 
-states = ["Alabama","Alaska","Arizona","Arkansas","California","Colorado","Connecticut","Delaware","Florida","Georgia","Hawaii","Idaho","Illinois","Indiana","Iowa","Kansas","Kentucky","Louisiana","Maine","Maryland","Massachusetts","Michigan","Minnesota","Mississippi","Missouri","Montana","Nebraska","Nevada","New Hampshire","New Jersey","New Mexico","New York","North Carolina","North Dakota","Ohio","Oklahoma","Oregon","Pennsylvania","Rhode Island","South Carolina","South Dakota","Tennessee","Texas","Utah","Vermont","Virginia","Washington","West Virginia","Wisconsin","Wyoming"]
+        if len(errors) > before:
+            continue
 
-def states_game():
+        # a game that pays out more than its tickets cost is a money printer.
+        # the jackpot share all gets paid out eventually, so it counts too.
+        # the prestige bonus doesn't: it's a reward players pay for, and
+        # letting them come out ahead with it is the point.
+        ev = expected_value(game) + pool_share * game["cost"]
+        if ev > game["cost"] * TICKET_PRICE:
+            errors.append(f"{key}: pays {ev:.2f} coins per play on average (jackpot share included), more than the {game['cost'] * TICKET_PRICE} its tickets cost")
 
-    state = states[random.randint(0, 49)]
+    return errors
 
-    outcome = state
 
-    if state == "New Hampshire":
-        text = "Based."
-        coins = 200,
-    elif state == "Ohio":
-        text = "Looks like you're going to the shadow realm, Jimbo"
-        coins = -950
-    else:
-        text = ""
-        coins = 25
+# loading ----------------------------------------------------------------------
 
-    result = {
-        "name": "State Roulette",
-        "description": "Don't get Ohio!",
-        "cost": 1,
-        "outcome": outcome,
-        "text": text,
-        "coins": coins,
-    }
+current = Definitions(DEFAULT_GAMES)
 
-    return result
+# mtime of the last GAMES_PATH we tried, good or bad, so the watcher doesn't
+# keep re-reading a broken file until someone changes it
+seen_mtime = None
+
+def reload():
+    """Load and validate GAMES_PATH (or the defaults, if it doesn't exist) and
+    swap it in. Raises ValueError and keeps the old games if it's no good."""
+    global current, seen_mtime
+
+    if os.path.isfile(GAMES_PATH):
+        mtime = os.path.getmtime(GAMES_PATH)
+        seen_mtime = mtime
+        try:
+            with open(GAMES_PATH) as fp:
+                games = json.load(fp)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{GAMES_PATH}: {e}")
+    else:
+        seen_mtime = None
+        games = DEFAULT_GAMES
 
+    defs = Definitions(games)
+    current = defs
+    return defs
 
+def changed():
+    mtime = os.path.getmtime(GAMES_PATH) if os.path.isfile(GAMES_PATH) else None
+    return mtime != seen_mtime
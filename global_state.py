@@ -1,48 +1,159 @@
 import pickle
 import os
 import barobets
+import jackpot
+import player
+from leaderboard import Leaderboard
+from archive import Archive
+from snapshots import atomic_write, STATE_VERSION
+from startup import Profiler
 
-def load(): 
-    if not os.path.isfile("data/state.pickle"):
+STATE_PATH = "data/state.pickle"
+
+def load(profile=None):
+    if profile == None:
+        profile = Profiler()
+
+    if not os.path.isfile(STATE_PATH):
         # make fresh state and save it
         s = State()
         s.save()
 
-    with open("data/state.pickle", "rb") as fp:
-        s = pickle.load(fp)
+    with profile.stage("read state"):
+        with open(STATE_PATH, "rb") as fp:
+            data = fp.read()
 
-        if not hasattr(s, "barobets"):
-            s.barobets = []
+    # players are rebuilt here, barobets stay pickled until someone asks for them
+    with profile.stage("unpickle state"):
+        s = pickle.loads(data)
 
-        return s
+    return s
 
 
 class State:
     def __init__(self):
         self.players = {}
-        self.barobets = []
+        self.barobets = {} # open games only, by id
+        self.next_barobet_id = 0
+        self.jackpot = jackpot.Jackpot()
+        self.leaderboard = Leaderboard()
+        self.archive = Archive()
+
+    # saved form: players as compact tuples, open barobets as individually
+    # pickled plain dicts. a game that hasn't been touched since load is written
+    # back as the same bytes it was read from. finished games live in the archive.
+    def __getstate__(self):
+        return {
+            "version": STATE_VERSION,
+            "player_fields": player.RECORD_FIELDS,
+            "players": {userid: p.to_record() for userid, p in self.players.items()},
+            "barobets": {id: self.pack_barobet(bb) for id, bb in self.barobets.items()},
+            "next_barobet_id": self.next_barobet_id,
+            "jackpot": self.jackpot.to_record(),
+        }
+
+    def __setstate__(self, d):
+        self.archive = Archive()
+        self.jackpot = jackpot.from_record(d.get("jackpot"))
+
+        if "version" not in d:
+            # old saves pickled the objects themselves
+            self.__dict__.update(d)
+            self.barobets = getattr(self, "barobets", [])
+        else:
+            self.players = {userid: player.from_record(userid, record, self)
+                            for userid, record in d["players"].items()}
+            self.barobets = d["barobets"]
+
+        # not saved, one sort here and it's kept in order from then on
+        self.leaderboard = Leaderboard()
+        for userid, p in self.players.items():
+            self.leaderboard.update(userid, p.leaderboard_value())
+
+        if isinstance(self.barobets, list):
+            # before the archive, games were a list indexed by id with None
+            # left behind for deleted games
+            self.next_barobet_id = len(self.barobets)
+            self.barobets = {id: bb for id, bb in enumerate(self.barobets) if bb != None}
+
+            # and finished games stayed in the list, move them to the archive.
+            # games finished since then are archived as they finish.
+            self.archive_finished()
+        else:
+            self.next_barobet_id = d["next_barobet_id"]
+
+        # the archive is never rolled back, so a state restored from an older
+        # snapshot mustn't hand out ids of games archived since
+        if self.archive.index:
+            self.next_barobet_id = max(self.next_barobet_id, max(self.archive.index) + 1)
+
+    def pack_barobet(self, bb):
+        if isinstance(bb, bytes):
+            return bb
+        return pickle.dumps(bb.to_record())
 
     def save(self):
-        with open("data/state.pickle", "wb") as fp:
-            pickle.dump(self, fp)
+        atomic_write(STATE_PATH, pickle.dumps(self))
 
     def get_player(self, userid):
         return self.players[userid]
 
     def add_player(self, userid, player):
         self.players[userid] = player
+        self.leaderboard.update(userid, player.leaderboard_value())
+        self.save()
+
+    def del_player(self, userid):
+        self.leaderboard.remove(userid)
+        p = self.players.pop(userid, None)
         self.save()
+        return p
 
     def get_players(self):
         return self.players
 
     def add_barobet(self, barobet):
-        self.barobets.append(barobet)
+        id = self.next_barobet_id
+        self.barobets[id] = barobet
+        self.next_barobet_id += 1
         self.save()
-        return len(self.barobets) - 1
+        return id
+
+    def barobet_id(self, id):
+        # negative ids count back from the newest game, like list indices
+        return self.next_barobet_id + id if id < 0 else id
 
     def get_barobet(self, id=-1):
-        return self.barobets[id]
+        """Returns the game, paging it in from the archive if it's finished, or
+        None if there is no such game or it was deleted."""
+        id = self.barobet_id(id)
+
+        if id in self.barobets:
+            bb = self.barobets[id]
+            if isinstance(bb, bytes):
+                bb = barobets.from_record(pickle.loads(bb), self)
+                self.barobets[id] = bb
+            return bb
+
+        record = self.archive.get(id)
+        if record == None or record.get("deleted", False):
+            return None
+        return barobets.from_record(record, self)
 
     def del_barobet(self, id=-1):
-        self.barobets[id] = None
+        bb = self.get_barobet(id)
+        if bb != None:
+            bb.deleted = True
+            self.archive_barobet(bb)
+        return bb
+
+    def archive_barobet(self, bb):
+        self.archive.add(bb.game_id, bb.to_record())
+        self.barobets.pop(bb.game_id, None)
+        self.save()
+
+    def archive_finished(self):
+        for id in list(self.barobets.keys()):
+            bb = self.get_barobet(id)
+            if bb.finished:
+                self.archive_barobet(bb)
@@ -0,0 +1,55 @@
+def from_record(record):
+    j = Jackpot()
+    if record != None:
+        j.__dict__.update(record)
+        j.pending_total = sum(j.pending.values())
+    return j
+
+class Jackpot:
+    """The progressive jackpot shared by every game with a "pool_share".
+
+    Ticket spend doesn't go straight into the pool: each player's share piles
+    up in their own entry in `pending`, and `settle` folds all of them into
+    the pool in one go (periodically, and always before anyone wins it). The
+    books always balance: pool == contributed - paid, once settled."""
+
+    def __init__(self):
+        self.pool = 0
+        self.contributed = 0
+        self.paid = 0
+        self.pending = {}
+        # sum of pending, kept up to date so total() doesn't walk every entry
+        self.pending_total = 0
+
+    def to_record(self):
+        # pending is changed in place, don't hand out the live dict.
+        # pending_total isn't saved, it's worked out again on load
+        record = {k: v for k, v in self.__dict__.items() if k != "pending_total"}
+        record["pending"] = dict(self.pending)
+        return record
+
+    def contribute(self, userid, coins):
+        self.pending[userid] = self.pending.get(userid, 0) + coins
+        self.pending_total += coins
+
+    def settle(self):
+        settled = self.pending_total
+        self.pool += settled
+        self.contributed += settled
+        self.pending = {}
+        self.pending_total = 0
+        return settled
+
+    def total(self):
+        """What a jackpot would pay right now, including unsettled shares."""
+        return self.pool + self.pending_total
+
+    def win(self):
+        self.settle()
+        won = self.pool
+        self.pool = 0
+        self.paid += won
+        return won
+
+    def balanced(self):
+        return self.pool == self.contributed - self.paid
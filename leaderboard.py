@@ -0,0 +1,29 @@
+import bisect
+
+class Leaderboard:
+    """User ids in leaderboard order, kept sorted as balances change instead
+    of sorting every player each time someone asks.
+
+    `keys` is sorted (-value, userid) pairs, so the best player is first and
+    ties go to whoever has the lower id."""
+
+    def __init__(self):
+        self.keys = []
+        self.values = {}
+
+    def update(self, userid, value):
+        old = self.values.get(userid)
+        if old == value:
+            return
+        if old != None:
+            del self.keys[bisect.bisect_left(self.keys, (-old, userid))]
+        bisect.insort(self.keys, (-value, userid))
+        self.values[userid] = value
+
+    def remove(self, userid):
+        old = self.values.pop(userid, None)
+        if old != None:
+            del self.keys[bisect.bisect_left(self.keys, (-old, userid))]
+
+    def top(self, count=None):
+        return [userid for value, userid in self.keys[:count]]
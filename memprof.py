@@ -0,0 +1,105 @@
+import asyncio
+import datetime as dt
+import gc
+import os
+import sys
+import tracemalloc
+import types
+
+DUMP_DIR = "data"
+
+# tracemalloc's cost grows with the number of frames kept per allocation, so
+# don't let anyone ask for a full traceback in production
+MAX_FRAMES = 10
+
+# and every allocation is tracked for as long as sampling is on, so it always
+# stops by itself
+DEFAULT_MINUTES = 10
+MAX_MINUTES = 60
+
+# lines in a top or objects listing, more than this won't fit in a message
+MAX_LINES = 20
+
+# what we compare dumps against, taken when sampling starts
+baseline = None
+stop_timer = None
+
+# things that are shared by everything and shouldn't count towards anyone
+SKIP_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType,
+              types.MethodType, types.CodeType)
+
+def start(frames=1, minutes=DEFAULT_MINUTES):
+    """Start sampling, and stop again after `minutes`. Has to be called from
+    the event loop. Returns the (frames, minutes) actually used."""
+    global baseline, stop_timer
+    frames = max(1, min(frames, MAX_FRAMES))
+    minutes = max(1, min(minutes, MAX_MINUTES))
+    stop()
+    tracemalloc.start(frames)
+    baseline = tracemalloc.take_snapshot()
+    stop_timer = asyncio.get_running_loop().call_later(minutes * 60, stop)
+    return frames, minutes
+
+def stop():
+    global baseline, stop_timer
+    if stop_timer != None:
+        stop_timer.cancel()
+        stop_timer = None
+    tracemalloc.stop()
+    baseline = None
+
+def top(limit=10):
+    """The biggest allocation sites since sampling started, as text lines."""
+    snapshot = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    lines = [f"traced {current / 1024:.0f} KiB (peak {peak / 1024:.0f} KiB)"]
+    for stat in snapshot.statistics("lineno")[:limit]:
+        frame = stat.traceback[0]
+        lines.append(f"{stat.size / 1024:8.1f} KiB {stat.count:7} {os.path.basename(frame.filename)}:{frame.lineno}")
+    return lines
+
+def dump(limit=25):
+    """Save a snapshot to DUMP_DIR along with a text diff against the
+    baseline. Returns the path of the diff."""
+    snapshot = tracemalloc.take_snapshot()
+    stamp = dt.datetime.now(dt.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    path = os.path.join(DUMP_DIR, f"memprof-{stamp}")
+
+    snapshot.dump(path + ".snapshot")
+    with open(path + ".txt", "w") as fp:
+        for stat in snapshot.compare_to(baseline, "lineno")[:limit]:
+            fp.write(f"{stat}\n")
+
+    return path + ".txt"
+
+def breakdown(roots, skip=()):
+    """Count and deep size of every object reachable from `roots`, by type.
+
+    Objects of the types in `skip` are not counted or followed (pass the
+    State class, or every player drags the whole state in)."""
+    skip = SKIP_TYPES + tuple(skip)
+    seen = set()
+    sizes = {}
+
+    stack = list(roots)
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, skip):
+            continue
+        seen.add(id(obj))
+
+        name = type(obj).__name__
+        count, size = sizes.get(name, (0, 0))
+        sizes[name] = (count + 1, size + sys.getsizeof(obj))
+
+        stack.extend(gc.get_referents(obj))
+
+    return sizes
+
+def format_breakdown(sizes, limit=10):
+    total = sum(size for count, size in sizes.values())
+    lines = [f"{total / 1024:8.1f} KiB total"]
+    ordered = sorted(sizes.items(), key=lambda x: x[1][1], reverse=True)
+    for name, (count, size) in ordered[:limit]:
+        lines.append(f"{size / 1024:8.1f} KiB {count:7} {name}")
+    return lines
@@ -1,5 +1,6 @@
 import json
 import datetime as dt
+import snapshots
 from common import *
 
 async def get(state, ctx):
@@ -13,6 +14,36 @@ async def get_id(state, userid, ctx):
         await ctx.send(f"Welcome <@{userid}>, an account has been created for you.")
         return player
 
+# the fields that are saved for each player, in order. new fields go on the end
+# so older saves still load.
+RECORD_FIELDS = ("tickets", "last_checked", "coins", "stocks", "prestige")
+
+def from_record(userid, record, state):
+    """Rebuild a player from the compact tuple made by `Player.to_record`."""
+    p = Player.__new__(Player)
+    p.userid = userid
+    p.state = state
+    for field, value in zip(RECORD_FIELDS, record):
+        setattr(p, field, value)
+    return p
+
+
+# prestige: once a player has PRESTIGE_THRESHOLDS[level] coins they can trade
+# that many in for the next level, which multiplies their game winnings for good.
+# everything is worked out up front so checking is a lookup and a compare.
+MAX_PRESTIGE = 10
+PRESTIGE_THRESHOLDS = [100000 * 2**level for level in range(MAX_PRESTIGE)]
+PRESTIGE_MULTIPLIERS = [1 + level / 20 for level in range(MAX_PRESTIGE + 1)]
+
+# coins traded in to reach each level, which still count on the leaderboard
+PRESTIGE_BANKED = [sum(PRESTIGE_THRESHOLDS[:level]) for level in range(MAX_PRESTIGE + 1)]
+
+def balance_history(userid):
+    """(times, coins) for a player from the snapshots, oldest first."""
+    coins = RECORD_FIELDS.index("coins")
+    history = snapshots.player_history(userid)
+    return [when for when, record in history], [record[coins] for when, record in history]
+
 
 class Player:
     def __init__(self, userid, state):
@@ -32,6 +63,9 @@ class Player:
     def save(self):
         self.state.save()
 
+    def to_record(self):
+        return tuple(getattr(self, field) for field in RECORD_FIELDS)
+
     async def color(self, ctx):
         color(ctx)
 
@@ -54,7 +88,7 @@ class Player:
 
     def buy_ticket(self):
         self.refresh_tickets()
-        if self.pay_coins(20):
+        if self.pay_coins(TICKET_PRICE):
             self.tickets += 1
             return True
         else:
@@ -64,11 +98,11 @@ class Player:
         # if not hasattr(self, "last_checked"):
         #     self.last_checked = dt.datetime(2000, 1, 1)
 
-        if self.last_checked.date() != dt.date.today():
+        if self.last_checked.date() != now().date():
             self.daily_tickets_update()
             self.save()
         
-        self.last_checked = dt.datetime.now()
+        self.last_checked = now()
 
     def daily_tickets_update(self):
         if self.tickets < 10:
@@ -81,6 +115,7 @@ class Player:
 
     def add_coins(self, count):
         self.coins += int(count)
+        self.balance_changed()
         self.check_prestige()
 
     # losing in a game doesn't kill your balance entirely
@@ -91,17 +126,42 @@ class Player:
                 self.coins -= int(count)
             else:
                 self.coins = 0
+        self.balance_changed()
 
     def pay_coins(self, count):
         if self.coins >= count:
             self.coins -= int(count)
+            self.balance_changed()
             return True
         else:
             return False
 
+    def balance_changed(self):
+        self.state.leaderboard.update(self.userid, self.leaderboard_value())
+
+    # PRESTIGE
+
+    def next_prestige_at(self):
+        if self.prestige >= MAX_PRESTIGE:
+            return None
+        return PRESTIGE_THRESHOLDS[self.prestige]
+
     def check_prestige(self):
-        # TODO
-        pass
+        """True if the player has enough coins to prestige."""
+        threshold = self.next_prestige_at()
+        return threshold != None and self.coins >= threshold
+
+    def do_prestige(self):
+        if not self.check_prestige():
+            return False
+        self.coins -= PRESTIGE_THRESHOLDS[self.prestige]
+        self.prestige += 1
+        self.balance_changed()
+        self.save()
+        return True
+
+    def payout_multiplier(self):
+        return PRESTIGE_MULTIPLIERS[self.prestige]
 
 
     # STOCKS
@@ -118,7 +178,7 @@ class Player:
         return self.coins
 
     def leaderboard_value(self):
-        return self.net_worth() + 100000*self.prestige
+        return self.net_worth() + PRESTIGE_BANKED[self.prestige]
 
     # UTILITIES
     async def send_status(self, ctx):
@@ -131,6 +191,8 @@ class Player:
     def add_status_embed(self, em, ctx):
         em.add_field(name="Tickets:", value=f"{self.get_tickets()} :tickets:", inline=True)
         em.add_field(name="Coins:", value=f"{self.get_coins()} {tornago(ctx)}", inline=True)
+        if self.prestige > 0:
+            em.add_field(name="Prestige:", value=f"{self.prestige} (x{self.payout_multiplier():g} winnings)", inline=True)
 
     async def get_user(self, ctx):
-        return await ctx.bot.fetch_user(self.userid)
+        return await fetch_user(ctx.bot, self.userid)
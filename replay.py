@@ -0,0 +1,266 @@
+"""Run a trace of commands (from `python bot.py --trace`, or made up with
+`generate`) against the game code offline, without discord.
+
+    python replay.py run data/trace.ndjson [--from state.pickle] [--repeat 3] [--expect DIGEST]
+    python replay.py generate 10000 workload.ndjson [--seed 0]
+
+Every run starts from the same state in a scratch directory, so runs have to
+end up with the same digest or something isn't deterministic. A trace from the
+bot starts with the state the bot started from (used unless --from says
+otherwise) and the digest the bot saw at startup and at every snapshot, and the
+replay has to match each of those as it goes. The timings double as a
+fixed-workload benchmark."""
+
+import argparse
+import asyncio
+import datetime as dt
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import common
+import barobets
+import games
+import global_state
+import player
+import rng
+import tracelog
+
+# stand-ins for the bits of discord the game code touches ----------------------
+
+class ReplayAvatar:
+    url = None
+
+class ReplayUser:
+    def __init__(self, userid):
+        self.id = userid
+        self.name = str(userid)
+        self.display_name = self.name
+        self.mention = f"<@{userid}>"
+        self.accent_color = None
+        self.avatar = ReplayAvatar()
+
+class ReplayBot:
+    def __init__(self):
+        self.emojis = []
+        self.sent = 0
+        self.failed = 0
+
+    def get_user(self, userid):
+        return ReplayUser(userid)
+
+    async def fetch_user(self, userid):
+        return ReplayUser(userid)
+
+class ReplayContext:
+    def __init__(self, bot, userid):
+        self.bot = bot
+        self.author = ReplayUser(userid)
+        self.guild = None
+
+    async def send(self, *args, **kwargs):
+        self.bot.sent += 1
+
+# replaying --------------------------------------------------------------------
+
+def parse_time(text):
+    return dt.datetime.fromisoformat(text) if text != None else None
+
+class Diverged(Exception):
+    def __init__(self, line, expected, got):
+        self.line = line
+        super().__init__(f"line {line}: the bot recorded {expected}, the replay has {got}")
+
+async def execute(commands, state, bot):
+    for n, c in enumerate(commands, start=1):
+        common.pinned_now.set(parse_time(c["time"]))
+
+        if c["command"] in ["start", "digest"]:
+            got = tracelog.digest(state)
+            if got != c["args"]["digest"]:
+                raise Diverged(n, c["args"]["digest"], got)
+            continue
+
+        # a command that failed in the bot fails the same way here, and
+        # keeps whatever it changed before it failed
+        try:
+            await execute_one(c, state, bot)
+        except Exception:
+            bot.failed += 1
+
+async def execute_one(c, state, bot):
+    ctx = ReplayContext(bot, c["userid"])
+    args = c["args"]
+
+    # same calls, in the same order, as the bot commands make
+    if c["command"] == "play":
+        await games.play(args["game"], state, ctx, testplay=args["testplay"], seed=args["seed"])
+
+    elif c["command"] == "bal":
+        p = await player.get(state, ctx)
+        await p.send_status(ctx)
+
+    elif c["command"] == "prestige":
+        p = await player.get(state, ctx)
+        p.do_prestige()
+
+    elif c["command"] == "buy_tickets":
+        p = await player.get(state, ctx)
+        for i in range(args["count"]):
+            p.buy_ticket()
+
+    elif c["command"] == "lockitin":
+        p = await player.get(state, ctx)
+        bb = state.get_barobet(args["id"])
+        if bb != None:
+            await bb.guess(p, args["pressure"], ctx, do_bet=args["do_bet"])
+
+    elif c["command"] == "settle_jackpot":
+        state.jackpot.settle()
+
+    elif c["command"] == "bbnew":
+        await barobets.new_game(parse_time(args["cyclone"]), state, ctx, close_dt=parse_time(args["close"]))
+
+    elif c["command"] == "bbdel":
+        state.del_barobet(id=args["id"])
+
+    elif c["command"] == "bbobs":
+        bb = state.get_barobet(args["id"])
+        if bb != None:
+            await bb.observe_pressure(args["pressure"])
+
+    elif c["command"] == "bbfinish":
+        bb = state.get_barobet(args["id"])
+        if bb != None:
+            await bb.send_rewards(ctx)
+
+    elif c["command"] in ["tickets", "coins"]:
+        p = await player.get_id(state, args["user"], ctx)
+        field = c["command"]
+        if field == "tickets":
+            p.refresh_tickets()
+
+        action = args["action"].lower()
+        if action == "set":
+            setattr(p, field, args["amount"])
+        elif action in ["add", "give"]:
+            setattr(p, field, getattr(p, field) + args["amount"])
+        elif action in ["take", "remove", "subtract", "sub"]:
+            setattr(p, field, getattr(p, field) - args["amount"])
+        else:
+            return
+
+        if field == "coins":
+            p.balance_changed()
+        await p.send_status(ctx)
+        p.save()
+
+    elif c["command"] == "delete_user":
+        state.del_player(args["user"])
+
+    else:
+        raise ValueError(f"Unknown command in trace: {c['command']}")
+
+def run(commands, start=None):
+    """Replay in a scratch data directory. Returns (digest, seconds)."""
+    cwd = os.getcwd()
+    scratch = tempfile.mkdtemp()
+    try:
+        os.makedirs(os.path.join(scratch, "data"))
+        if start != None:
+            shutil.copyfile(start, os.path.join(scratch, global_state.STATE_PATH))
+        os.chdir(scratch)
+
+        state = global_state.load()
+        bot = ReplayBot()
+
+        began = time.perf_counter()
+        asyncio.run(execute(commands, state, bot))
+        seconds = time.perf_counter() - began
+
+        return tracelog.digest(state), seconds
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(scratch)
+
+def generate(count, seed=0):
+    """A made-up but always identical workload: 100 players, mostly playing
+    games, sometimes buying tickets or guessing on one barobet."""
+    stream = rng.Stream(seed)
+    start = dt.datetime(2024, 1, 1, tzinfo=dt.timezone.utc)
+    names = ["d6", "d20", "l8", "lotto", "lottox", "states"]
+
+    def line(t, command, userid, **args):
+        return {"time": t.isoformat(), "command": command, "userid": userid, "args": args}
+
+    yield line(start, "bbnew", common.ADMIN,
+               cyclone=(start + dt.timedelta(days=60)).isoformat(), close=None)
+
+    for i in range(count):
+        t = start + dt.timedelta(minutes=i)
+        userid = 1000 + stream.randint(0, 99)
+        kind = stream.randint(1, 20)
+        if kind <= 16:
+            game = names[stream.randint(0, len(names) - 1)]
+            yield line(t, "play", userid, game=game, testplay=False, seed=stream.next64())
+        elif kind <= 18:
+            yield line(t, "buy_tickets", userid, count=stream.randint(1, 3))
+        else:
+            pressure = 950 + stream.randint(0, 800) / 10
+            yield line(t, "lockitin", userid, pressure=pressure, id=0, do_bet=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay command traces offline.")
+    sub = parser.add_subparsers(dest="action", required=True)
+
+    p_run = sub.add_parser("run")
+    p_run.add_argument("trace")
+    p_run.add_argument("--from", dest="start", help="state.pickle to start from, the trace's own or empty state if not given")
+    p_run.add_argument("--repeat", type=int, default=2)
+    p_run.add_argument("--expect", help="digest the final state has to match")
+
+    p_gen = sub.add_parser("generate")
+    p_gen.add_argument("count", type=int)
+    p_gen.add_argument("out")
+    p_gen.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+
+    if args.action == "generate":
+        with open(args.out, "w") as fp:
+            for line in generate(args.count, args.seed):
+                fp.write(json.dumps(line) + "\n")
+        sys.exit(0)
+
+    with open(args.trace) as fp:
+        commands = [json.loads(line) for line in fp if line.strip()]
+    start = args.start
+    if start == None and len(commands) > 0 and commands[0]["command"] == "start":
+        start = commands[0]["args"]["state"]
+    start = os.path.abspath(start) if start != None else None
+
+    digests = set()
+    times = []
+    for i in range(args.repeat):
+        try:
+            d, seconds = run(commands, start)
+        except Diverged as e:
+            print(f"Replay diverged from the bot at {e}")
+            sys.exit(1)
+        digests.add(d)
+        times.append(seconds)
+        print(f"run {i + 1}: {len(commands)} commands in {seconds:.3f}s ({len(commands) / seconds:.0f}/s)  {d}")
+
+    print(f"median {statistics.median(times):.3f}s, best {min(times):.3f}s")
+
+    if len(digests) > 1:
+        print("Runs ended in different states, replay is not deterministic")
+        sys.exit(1)
+    if args.expect != None and args.expect not in digests:
+        print(f"Final state does not match {args.expect}")
+        sys.exit(1)
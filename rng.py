@@ -0,0 +1,29 @@
+import hashlib
+import secrets
+
+def new_seed():
+    return secrets.randbits(64)
+
+class Stream:
+    """Counter-based random numbers: draw n of a stream is a hash of (seed, n),
+    so a play can be repeated exactly from its seed alone, and nothing depends
+    on what any other play drew before it."""
+
+    def __init__(self, seed, counter=0):
+        self.seed = seed
+        self.counter = counter
+
+    def next64(self):
+        data = self.seed.to_bytes(8, "big") + self.counter.to_bytes(8, "big")
+        self.counter += 1
+        return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+    def randint(self, a, b):
+        """Like random.randint, inclusive at both ends."""
+        n = b - a + 1
+        # throw away the top sliver of draws so every result is equally likely
+        limit = 2**64 - (2**64 % n)
+        while True:
+            x = self.next64()
+            if x < limit:
+                return a + x % n
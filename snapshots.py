@@ -0,0 +1,196 @@
+import datetime as dt
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import sys
+import zlib
+
+# version of the saved form of the state, see State.__getstate__. it lives here
+# so tools that only deal with snapshots don't need the bot's modules
+STATE_VERSION = 3
+
+SNAPSHOT_DIR = "data/snapshots"
+OBJECT_DIR = os.path.join(SNAPSHOT_DIR, "objects")
+
+# players are split into this many chunks by user id, so a player always lands
+# in the same chunk and chunks nobody played in hash the same as last time
+CHUNKS = 64
+
+TIME_FORMAT = "%Y%m%dT%H%M%SZ"
+
+# files ------------------------------------------------------------------------
+
+def atomic_write(path, data):
+    """Write to a temp file and rename it over `path`, so a crash leaves either
+    the old file or the new one, never half of one."""
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as fp:
+        fp.write(data)
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(tmp, path)
+
+    # make the rename itself stick
+    dir_fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+def put_object(data):
+    """Store a chunk under its hash, returns (hash, whether it was new)."""
+    digest = hashlib.sha256(data).hexdigest()
+    path = os.path.join(OBJECT_DIR, digest)
+    if os.path.isfile(path):
+        return digest, False
+    atomic_write(path, zlib.compress(data))
+    return digest, True
+
+def get_object(digest):
+    with open(os.path.join(OBJECT_DIR, digest), "rb") as fp:
+        return zlib.decompress(fp.read())
+
+# snapshots --------------------------------------------------------------------
+
+def take(state, when=None):
+    """Snapshot the state. Only chunks that changed since an earlier snapshot
+    are written, the rest are shared by hash.
+
+    Returns (manifest path, chunks written, chunks total). The barobet archive
+    is append-only so it isn't part of snapshots."""
+    return write(capture(state), when)
+
+def capture(state):
+    """The cheap half of a snapshot: copy out the saved form of the state,
+    split into chunks. Has to run wherever the state is being changed (the
+    event loop), `write` can then run anywhere."""
+    d = state.__getstate__()
+
+    buckets = [[] for _ in range(CHUNKS)]
+    for userid, record in d.pop("players").items():
+        buckets[userid % CHUNKS].append((userid, record))
+
+    return buckets, d
+
+def write(captured, when=None):
+    """The slow half: pickle, hash and write the chunks from `capture`."""
+    buckets, d = captured
+    if when == None:
+        when = dt.datetime.now(dt.timezone.utc)
+
+    os.makedirs(OBJECT_DIR, exist_ok=True)
+
+    written = 0
+    chunks = []
+    for bucket in buckets:
+        digest, new = put_object(pickle.dumps(sorted(bucket)))
+        chunks.append(digest)
+        written += new
+
+    rest, new = put_object(pickle.dumps(d))
+    written += new
+
+    path = write_manifest(when, chunks, rest)
+    return path, written, len(chunks) + 1
+
+def write_manifest(when, chunks, rest):
+    manifest = {
+        "time": when.isoformat(),
+        "players": chunks,
+        "rest": rest,
+    }
+    path = os.path.join(SNAPSHOT_DIR, when.strftime(TIME_FORMAT) + ".json")
+    atomic_write(path, json.dumps(manifest).encode())
+    return path
+
+def manifests():
+    """All snapshot times and manifest paths, oldest first."""
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return []
+
+    found = []
+    for name in os.listdir(SNAPSHOT_DIR):
+        if name.endswith(".json"):
+            when = dt.datetime.strptime(name[:-5], TIME_FORMAT).replace(tzinfo=dt.timezone.utc)
+            found.append((when, os.path.join(SNAPSHOT_DIR, name)))
+    return sorted(found)
+
+def find(when):
+    """The manifest path of the latest snapshot taken at or before `when`."""
+    found = [path for time, path in manifests() if time <= when]
+    return found[-1] if found else None
+
+def read(path):
+    """Rebuild the saved form of the state (see `State.__getstate__`) from a
+    manifest."""
+    with open(path) as fp:
+        manifest = json.load(fp)
+
+    d = pickle.loads(get_object(manifest["rest"]))
+    d["players"] = {}
+    for digest in manifest["players"]:
+        d["players"].update(pickle.loads(get_object(digest)))
+    return d
+
+def player_history(userid):
+    """Every snapshot of one player as (time, record), oldest first. Only the
+    one chunk the player lives in is read, and only once per distinct chunk."""
+    history = []
+    digest, chunk = None, {}
+    for when, path in manifests():
+        with open(path) as fp:
+            manifest = json.load(fp)
+
+        chunks = manifest["players"]
+        if chunks[userid % len(chunks)] != digest:
+            digest = chunks[userid % len(chunks)]
+            chunk = dict(pickle.loads(get_object(digest)))
+
+        if userid in chunk:
+            history.append((when, chunk[userid]))
+    return history
+
+def restore(when):
+    """Rebuild data/state.pickle as it was at `when`. The current file is kept
+    as data/state.pickle.bak."""
+    import global_state
+
+    path = find(when)
+    if path == None:
+        return None
+
+    s = global_state.State.__new__(global_state.State)
+    s.__setstate__(read(path))
+
+    if os.path.isfile(global_state.STATE_PATH):
+        shutil.copyfile(global_state.STATE_PATH, global_state.STATE_PATH + ".bak")
+    s.save()
+
+    return path
+
+def parse_time(text):
+    when = dt.datetime.fromisoformat(text)
+    if when.tzinfo == None:
+        when = when.replace(tzinfo=dt.timezone.utc)
+    return when
+
+
+# python snapshots.py list
+# python snapshots.py restore 2024-12-01T18:00   (UTC unless given an offset)
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "list":
+        for when, path in manifests():
+            print(f"{when.isoformat()}  {path}")
+
+    elif len(sys.argv) == 3 and sys.argv[1] == "restore":
+        path = restore(parse_time(sys.argv[2]))
+        if path == None:
+            print(f"No snapshot at or before {sys.argv[2]}")
+            sys.exit(1)
+        print(f"Restored state from {path}")
+
+    else:
+        print("usage: python snapshots.py list | restore <time>")
+        sys.exit(2)
@@ -0,0 +1,48 @@
+import importlib
+import time
+from contextlib import contextmanager
+
+class Profiler:
+    """Times the stages of bringing the bot up. Only prints when enabled
+    (`python bot.py --profile-startup`), timing itself is always on since it's
+    a handful of perf_counter calls."""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.started = time.perf_counter()
+        self.running = {}
+        self.stages = []
+
+    def begin(self, name):
+        self.running[name] = time.perf_counter()
+
+    def end(self, name):
+        start = self.running.pop(name, None)
+        if start != None:
+            self.stages.append((name, time.perf_counter() - start))
+
+    @contextmanager
+    def stage(self, name):
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end(name)
+
+    def imports(self, *names):
+        """Import each module by name, timing them one at a time."""
+        modules = []
+        for name in names:
+            with self.stage(f"import {name}"):
+                modules.append(importlib.import_module(name))
+        return modules
+
+    def report(self):
+        if not self.enabled:
+            return
+
+        total = time.perf_counter() - self.started
+        print("Startup profile:")
+        for name, seconds in self.stages:
+            print(f"  {seconds*1000:9.1f} ms  {name}")
+        print(f"  {total*1000:9.1f} ms  total")
@@ -0,0 +1,37 @@
+import os
+import re
+import time
+from collections import deque
+
+PRICE_DIR = "data/prices"
+
+# trades come in far faster than anyone needs for a chart
+MIN_INTERVAL = 60 # seconds
+
+last_recorded = {}
+
+def price_path(symbol):
+    return os.path.join(PRICE_DIR, re.sub(r"[^A-Za-z0-9]+", "_", symbol) + ".csv")
+
+def record(symbol, price, when=None):
+    """Append a price to the symbol's history, at most once a minute."""
+    if when == None:
+        when = time.time()
+    if when - last_recorded.get(symbol, 0) < MIN_INTERVAL:
+        return
+    last_recorded[symbol] = when
+
+    os.makedirs(PRICE_DIR, exist_ok=True)
+    with open(price_path(symbol), "a") as fp:
+        fp.write(f"{when},{price}\n")
+
+def history(symbol, limit=2000):
+    """The last `limit` recorded (times, prices) for a symbol."""
+    path = price_path(symbol)
+    if not os.path.isfile(path):
+        return [], []
+
+    with open(path) as fp:
+        rows = deque((line.split(",") for line in fp if line.strip()), maxlen=limit)
+
+    return [float(t) for t, p in rows], [float(p) for t, p in rows]
@@ -0,0 +1,51 @@
+import hashlib
+import json
+import pickle
+import shutil
+
+import common
+from common import *
+
+# python bot.py --trace writes every command that changes the state here, so it
+# can be run again offline with replay.py. each run of the bot starts a fresh
+# trace, with a copy of the state it started from and the digest of that state,
+# and adds the digest again at every snapshot so replays can be checked
+# against what really happened.
+TRACE_PATH = "data/trace.ndjson"
+START_PATH = "data/trace-start.pickle"
+
+enabled = False
+
+def record(command, userid, **args):
+    if not enabled:
+        return
+    line = {"time": now().isoformat(), "command": command, "userid": userid, "args": args}
+    with open(TRACE_PATH, "a") as fp:
+        fp.write(json.dumps(line) + "\n")
+
+def digest(state):
+    """Hash of the saved form of the state. Open barobets are saved as
+    whatever bytes they were loaded from until something unpickles them, so
+    they're all repacked here to hash the same however they've been used."""
+    d = state.__getstate__()
+    d["barobets"] = {id: pickle.dumps(state.get_barobet(id).to_record()) for id in d["barobets"]}
+    return hashlib.sha256(pickle.dumps(d)).hexdigest()
+
+def start(state, state_path):
+    if not enabled:
+        return
+    shutil.copyfile(state_path, START_PATH)
+    open(TRACE_PATH, "w").close()
+    record("start", None, state=START_PATH, digest=digest(state))
+
+def checkpoint(state):
+    if not enabled:
+        return
+    record("digest", None, digest=digest(state))
+
+# the live bot pins the time for the length of each command while tracing, so
+# everything a command does sees the same time as its trace line. only the
+# command's own task sees it, and it goes away with the task.
+def pin_time():
+    if enabled:
+        common.pinned_now.set(dt.datetime.now(dt.timezone.utc))
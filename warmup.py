@@ -0,0 +1,41 @@
+import time
+
+import discord
+
+from common import *
+
+# discord only lets us ask for 100 members by id per request
+CHUNK_SIZE = 100
+
+async def warm(bot, state):
+    """Fill the user and emoji caches for every known player.
+
+    Returns (seconds taken, players resolved, players known)."""
+    start = time.perf_counter()
+
+    userids = list(state.get_players().keys())
+
+    for guild in bot.guilds:
+        missing = [u for u in userids if guild.get_member(u) == None]
+        for i in range(0, len(missing), CHUNK_SIZE):
+            chunk = missing[i:i+CHUNK_SIZE]
+            try:
+                await guild.query_members(user_ids=chunk, limit=len(chunk), cache=True)
+            except (discord.HTTPException, discord.ClientException, TimeoutError) as e:
+                print(f"Could not query members of {guild.name}: {e}")
+                break
+
+    # anyone not in a guild we can see has to come over REST, once
+    for userid in userids:
+        if bot.get_user(userid) == None and userid not in user_cache:
+            try:
+                user_cache[userid] = await bot.fetch_user(userid)
+            except discord.HTTPException:
+                pass
+
+    for emoji in bot.emojis:
+        emoji_cache[emoji.name] = emoji
+
+    resolved = sum(1 for u in userids if bot.get_user(u) != None or u in user_cache)
+
+    return time.perf_counter() - start, resolved, len(userids)